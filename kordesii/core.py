@@ -337,9 +337,7 @@ def run_ida(
         for root, dirs, files in os.walk(output_dir_path):
             for file in files:
                 file_path = os.path.join(root, file)
-                with open(file_path, "rb") as fo:
-                    file_data = fo.read()
-                reporter.add_output_file(file, file_data)
+                reporter.add_output_file(file, path=file_path)
 
     # Perform cleanup as specified in the parameters
     if cleanup_txt_files:
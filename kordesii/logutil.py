@@ -9,6 +9,8 @@ import logging
 import logging.config
 import logging.handlers
 import os
+import pickle
+import socketserver
 import struct
 import sys
 import threading
@@ -19,7 +21,6 @@ from collections import deque
 import kordesii
 import kordesii.config as kordesii_config
 import yaml
-from six.moves import socketserver, cPickle as pickle
 
 
 class LevelCharFilter(logging.Filter):
@@ -4,7 +4,10 @@ DC3-Kordesii framework primary object used for execution of decoders and collect
 
 import base64
 import codecs
+import collections
+import concurrent.futures
 import contextlib
+import copy
 import hashlib
 import io
 import os
@@ -12,6 +15,8 @@ import logging
 import shutil
 import sys
 import tempfile
+import threading
+import weakref
 from typing import List, Optional
 
 import kordesii
@@ -20,30 +25,157 @@ from kordesii.serialization import deserialize
 
 logger = logging.getLogger(__name__)
 ascii_writer = codecs.getwriter("ascii")
+_unicode_escape_encode = codecs.getencoder("unicode_escape")
 
 # Constant fields
 FIELD_DEBUG = "debug"
 FIELD_STRINGS = "strings"
 FIELD_FILES = "files"
 
+# Size of chunks used when hashing output files.
+_CHUNK_SIZE = 1 << 16
+
+# Process wide cache of deserialized yml data keyed by digest of the yml contents.
+_YML_CACHE_SIZE = 64
+_yml_cache = collections.OrderedDict()
+_yml_cache_lock = threading.Lock()
+
+# Number of base64 decoded output files get_file_contents() holds onto per Reporter.
+_FILE_CACHE_SIZE = 8
+
+
+def _deserialize_cached(yml_data):
+    """
+    Deserializes the given yml data, reusing previous results for identical data.
+    (A copy of the cached data is returned so callers can't modify each other's results.)
+    """
+    if not yml_data:
+        return deserialize(yml_data)
+
+    key = hashlib.blake2b(yml_data, digest_size=16).digest()
+    with _yml_cache_lock:
+        try:
+            _yml_cache.move_to_end(key)
+            data = _yml_cache[key]
+        except KeyError:
+            data = None
+
+    if data is None:
+        data = deserialize(yml_data)
+        with _yml_cache_lock:
+            _yml_cache[key] = data
+            if len(_yml_cache) > _YML_CACHE_SIZE:
+                _yml_cache.popitem(last=False)
+
+    return copy.deepcopy(data)
+
+
+def _to_unicode(input_string):
+    """
+    Converts given string to unicode, decoding as utf8 if necessary.
+    """
+    if isinstance(input_string, str):
+        return input_string
+    return str(input_string, encoding="utf8", errors="replace")
+
+
+def _md5_buffer(data):
+    """
+    Computes the md5 hexdigest of the given buffer in chunks.
+    (Slicing a memoryview avoids copying for any object supporting the buffer protocol.)
+    """
+    md5 = hashlib.md5()
+    view = memoryview(data).cast("B")
+    for offset in range(0, len(view), _CHUNK_SIZE):
+        md5.update(view[offset : offset + _CHUNK_SIZE])
+    return md5.hexdigest()
+
+
+def _write_file(path, data):
+    """
+    Writes given data to a new file using the raw file descriptor.
+    (Avoids the extra copy done by the buffered writer and preallocates the file when supported.)
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o600)
+    try:
+        view = memoryview(data).cast("B")
+        size = len(view)
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                pass  # Not supported by file system.
+        offset = 0
+        while offset < size:
+            offset += os.write(fd, view[offset:])
+    finally:
+        os.close(fd)
+
+
+def _batch_unicode_escape(strings):
+    """
+    Unicode escapes the given strings, returning them as newline terminated lines.
+
+    Escaping only ever lengthens a string, so the common case of no string needing escaping
+    can be detected with a single codec call over all the strings joined together.
+    """
+    if not strings:
+        return u""
+    joined = u"".join(strings)
+    if len(_unicode_escape_encode(joined)[0]) == len(joined):
+        return u"\n".join(strings) + u"\n"
+    return u"".join(u"{}\n".format(_unicode_escape_encode(item)[0].decode("ascii")) for item in strings)
+
+
+class _NullWriter(io.TextIOBase):
+    """Text stream which discards everything written to it."""
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        return len(s)
+
+
+_null_writer = _NullWriter()
+
+# Used for formatting tracebacks since the handler may not have a formatter set.
+_exc_formatter = logging.Formatter()
+
 
 class ReporterLogHandler(logging.Handler):
     """Custom logging handler used to keep backwards compatible with legacy logging mechanism."""
 
     def __init__(self, reporter):
         super(ReporterLogHandler, self).__init__()
-        self._reporter = reporter
+        # Weakly referenced since the reporter holds onto this handler.
+        # (Avoids a reference cycle which would keep the reporter and its files alive until garbage collection.)
+        self._reporter = weakref.ref(reporter)
+        self._debug_append = None
+
+    def reset(self):
+        """Resets cached state. Must be called whenever the reporter's metadata is replaced."""
+        self._debug_append = None
 
     def emit(self, record):
-        message = self.format(record)
+        reporter = self._reporter()
+        if reporter is None:
+            return
+        # Formatting is done inline to avoid the overhead of the Formatter.
+        message = record.getMessage()
+        if record.exc_info:
+            message = "{}\n{}".format(message, _exc_formatter.formatException(record.exc_info))
         if record.levelno > logging.WARNING:
-            self._reporter.errors.append(message)
+            # Errors are collected without the level prefix.
+            reporter.errors.append(message)
         # Even though reporter uses the name "debug".. This really is an INFO level debug message.
         # (Adding true DEBUG level messages would spam our console.)
-        elif logging.INFO <= record.levelno <= logging.WARNING:
-            if "debug" not in self._reporter.metadata:
-                self._reporter.metadata["debug"] = []
-            self._reporter.metadata["debug"].append(message)
+        elif logging.INFO <= record.levelno:
+            if self._debug_append is None:
+                # (Using underlying dictionary so reading metadata doesn't trim reserved strings on every log.)
+                self._debug_append = reporter._metadata.setdefault("debug", []).append
+            # (level_char is set by the LevelCharFilter)
+            self._debug_append("[{}] {}".format(record.level_char, message))
 
 
 class Reporter(object):
@@ -73,20 +205,60 @@ class Reporter(object):
 
     def __init__(self, tempdir=None, disabletempcleanup=False, base64outputfiles=False):
         self.tempdir = tempdir or tempfile.gettempdir()
-        self.metadata = {}
+        self._metadata = {}
         self.errors = []
         # TODO: Remove disassembler specific details from reporter.
         self.ida_log = ""
 
-        self._log_handler = None
+        # To keep backwards compatibility, setup log handler to add errors and debug messages to reporter.
+        # (Handler is created once and only attached to the root logger while running a decoder.)
+        # TODO: Remove this when the Reporter object should no longer be responsible for logging.
+        self._log_handler = ReporterLogHandler(self)
+        # Messages are formatted as "[%(level_char)s] %(message)s" by the handler.
+        self._log_handler.addFilter(logutil.LevelCharFilter())
+        self._log_handler_attached = False
+
         self._temp_file_name = ""
         self._managed_tempdir = ""
+        # Whether there are temporary files that need to be cleaned up.
+        self._needs_cleanup = False
 
         self._disable_temp_cleanup = disabletempcleanup
         self._base64_output_files = base64outputfiles
 
         self._other_data = None
         self._deserialized_data = {}
+        self._files_by_name = {}
+        self._file_bytes_cache = collections.OrderedDict()
+        self._raw_files = {}
+        self._pending_b64 = []
+        self._strings_cursor = None
+
+    @property
+    def metadata(self):
+        """
+        Dictionary containing the metadata extracted from the malware by the decoder.
+
+        :rtype: dict
+        """
+        self._trim_strings()
+        # Base64 encode any output files which have been deferred.
+        # (The raw contents are dropped afterwards so only one copy is held. get_file_contents() decodes on demand
+        # and only caches the most recently decoded files.)
+        if self._pending_b64:
+            raw_files = self._raw_files
+            for entry, data in self._pending_b64:
+                entry[3] = base64.b64encode(data).decode("latin1")
+                if raw_files.get(entry[0]) is data:
+                    del raw_files[entry[0]]
+            self._pending_b64 = []
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value):
+        self._metadata = value
+        self._strings_cursor = None
+        self._log_handler.reset()
 
     @property
     def other_data(self):
@@ -111,7 +283,7 @@ class Reporter(object):
         if name in _deserialized_data:
             return _deserialized_data[name]
         yml_data = self.get_file_contents("{}.yml".format(name))
-        data = deserialize(yml_data)
+        data = _deserialize_cached(yml_data)
         _deserialized_data[name] = data
         return data
 
@@ -123,62 +295,167 @@ class Reporter(object):
 
         if not self._managed_tempdir:
             self._managed_tempdir = tempfile.mkdtemp(dir=self.tempdir, prefix="kordesii-managed_tempdir-")
+            self._needs_cleanup = True
 
             if self._disable_temp_cleanup:
                 logger.debug("Using managed temp dir: %s" % self._managed_tempdir)
 
         return self._managed_tempdir
 
+    def reserve_strings(self, count):
+        """
+        Preallocates room for the given number of strings to be recorded.
+        Useful for avoiding reallocations when a decoder knows how many strings it will be reporting.
+
+        :param int count: number of strings expected to be added
+        """
+        if count <= 0:
+            return
+        if self._strings_cursor is None:
+            # Slots are added to a new list so a strings list already handed out by get_strings() or metadata
+            # never picks up the placeholders.
+            strings = list(self._metadata.get(FIELD_STRINGS, ()))
+            self._metadata[FIELD_STRINGS] = strings
+            self._strings_cursor = len(strings)
+        else:
+            strings = self._metadata[FIELD_STRINGS]
+        strings.extend([None] * count)
+
+    def _trim_strings(self):
+        """
+        Removes any unused slots from reserve_strings() so the recorded strings can be read.
+        (Any remaining reservation is dropped, after which strings are appended as normal.)
+        """
+        cursor = self._strings_cursor
+        if cursor is not None:
+            del self._metadata[FIELD_STRINGS][cursor:]
+            self._strings_cursor = None
+
     def add_string(self, string):
         """
         Record a decoded string
         """
-        fieldu = self.convert_to_unicode(FIELD_STRINGS)
         stringu = self.convert_to_unicode(string)
 
-        if fieldu not in self.metadata:
-            self.metadata[fieldu] = []
-
-        self.metadata[fieldu].append(stringu)
+        cursor = self._strings_cursor
+        if cursor is None:
+            self._metadata.setdefault(FIELD_STRINGS, []).append(stringu)
+        else:
+            strings = self._metadata[FIELD_STRINGS]
+            strings[cursor] = stringu
+            cursor += 1
+            # Go back to appending once we have used up the reserved slots.
+            self._strings_cursor = cursor if cursor < len(strings) else None
 
     def get_strings(self) -> List[str]:
         """
         Get a list of any recorded strings.
         """
-        if FIELD_STRINGS in self.metadata:
-            return self.metadata[FIELD_STRINGS]
+        self._trim_strings()
+        if FIELD_STRINGS in self._metadata:
+            return self._metadata[FIELD_STRINGS]
 
         return []
 
-    def add_output_file(self, filename, data, description=""):
+    def _digest_file(self, file_object):
+        """
+        Computes the md5 of the given file object in fixed-size chunks so the contents never need
+        to be fully buffered.
+
+        :param file_object: binary file-like object supporting readinto()
+
+        :return: md5 hexdigest
+        """
+        md5 = hashlib.md5()
+        buf = bytearray(_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            size = file_object.readinto(buf)
+            if not size:
+                break
+            md5.update(view[:size])
+        return md5.hexdigest()
+
+    def add_output_file(self, filename, data=None, description="", *, path=None):
         """
         Add file and its data to metadata.
+
+        :param filename: name of the output file
+        :param data: contents of the file
+        :param description: description of the file
+        :param path: path to a file on disk to pull contents from instead of data
+            (contents are streamed in chunks rather than read into memory if not base64 encoding output files)
         """
-        fieldu = self.convert_to_unicode(FIELD_FILES)
+        if data is None and path is None:
+            raise ValueError("data or path must be provided.")
+
         filenameu = self.convert_to_unicode(filename)
         descriptionu = self.convert_to_unicode(description)
-        md5 = hashlib.md5(data).hexdigest()
 
-        if fieldu not in self.metadata:
-            self.metadata[fieldu] = []
+        # Serialized data files are always kept in raw form so get_serialized() can access them
+        # without a base64 round trip.
+        keep_raw = self._base64_output_files or filenameu.endswith(".yml")
+
+        if data is None and keep_raw:
+            # We need to hold onto the contents anyway, so just read it all.
+            with open(path, "rb") as fo:
+                data = fo.read()
+
+        if data is None:
+            with open(path, "rb", buffering=0) as fo:
+                md5 = self._digest_file(fo)
+        else:
+            # Snapshot the contents so later changes to a mutable buffer (e.g. bytearray) by the caller
+            # don't affect what was hashed and stored. (This is not a copy if data is already bytes.)
+            data = bytes(data)
+            md5 = _md5_buffer(data)
+
+        if keep_raw:
+            self._raw_files[filenameu] = data
+        else:
+            self._raw_files.pop(filenameu, None)
 
         if self._base64_output_files:
-            self.metadata[fieldu].append([filenameu, descriptionu, md5, base64.b64encode(data).decode("latin1")])
+            # Base64 encoding is deferred until metadata is requested.
+            entry = [filenameu, descriptionu, md5, None]
+            self._pending_b64.append((entry, data))
         else:
-            self.metadata[fieldu].append([filenameu, descriptionu, md5])
+            entry = [filenameu, descriptionu, md5]
+        self._metadata.setdefault(FIELD_FILES, []).append(entry)
+        self._files_by_name[filenameu] = entry
+        # Invalidate any cached contents from a previously added file of the same name.
+        self._file_bytes_cache.pop(filenameu, None)
+        if filenameu.endswith(".yml"):
+            self._deserialized_data.pop(filenameu[:-4], None)
 
         if filenameu == u"other_data.yml":
-            self.metadata["other_data"] = data.decode("latin1")
+            self._metadata["other_data"] = data.decode("latin1")
 
     def get_file_contents(self, filename) -> Optional[bytes]:
         """
         If the file name exists and has its contents are stored in the reporter, then take
         the base64 encoded contents, base64 decode it, and return it.
         """
-        if FIELD_FILES in self.metadata:
-            for entry in self.metadata[FIELD_FILES]:
-                if entry[0] == filename and len(entry) == 4:
-                    return base64.b64decode(entry[3])
+        try:
+            return self._raw_files[filename]
+        except KeyError:
+            pass
+
+        file_bytes_cache = self._file_bytes_cache
+        try:
+            file_bytes_cache.move_to_end(filename)
+            return file_bytes_cache[filename]
+        except KeyError:
+            pass
+
+        entry = self._files_by_name.get(filename)
+        if entry and len(entry) == 4 and entry[3] is not None:
+            data = base64.b64decode(entry[3])
+            # Cache is bounded so decoded copies of every output file don't accumulate.
+            file_bytes_cache[filename] = data
+            if len(file_bytes_cache) > _FILE_CACHE_SIZE:
+                file_bytes_cache.popitem(last=False)
+            return data
 
         return None
 
@@ -200,9 +477,15 @@ class Reporter(object):
             input_file = filename
         else:
             # we were passed data buffer. Lazy initialize a temp file for this
-            input_file = os.path.join(self.managed_tempdir(), hashlib.md5(data).hexdigest())
-            with open(input_file, "wb") as file_object:
-                file_object.write(data)
+            # Since the file is named after its md5, write to a placeholder in the background while hashing.
+            tempdir = self.managed_tempdir()
+            fd, temp_path = tempfile.mkstemp(dir=tempdir)
+            os.close(fd)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(_write_file, temp_path, data)
+                input_file = os.path.join(tempdir, _md5_buffer(data))
+                future.result()
+            os.replace(temp_path, input_file)
 
         try:
             with self.__redirect_stdout():
@@ -221,11 +504,7 @@ class Reporter(object):
         finally:
             self.__cleanup()
 
-    def convert_to_unicode(self, input_string):
-        if isinstance(input_string, str):
-            return input_string
-        else:
-            return str(input_string, encoding="utf8", errors="replace")
+    convert_to_unicode = staticmethod(_to_unicode)
 
     def print_report(self):
         """
@@ -243,50 +522,58 @@ class Reporter(object):
         Get data in human readable report format.
         """
 
-        output = u""
+        # (Using underlying dictionary since we don't need base64 encoded files.)
+        self._trim_strings()
+        metadata = self._metadata
+        parts = [u"----Decoded Strings----\n\n"]
 
-        output += u"----Decoded Strings----\n\n"
-
-        if FIELD_STRINGS not in self.metadata:
-            output += u"No decoded strings found\n"
+        if FIELD_STRINGS not in metadata:
+            parts.append(u"No decoded strings found\n")
         else:
-            for item in self.metadata[FIELD_STRINGS]:
-                output += u"{}\n".format(item.encode("unicode-escape").decode())
+            parts.append(_batch_unicode_escape(metadata[FIELD_STRINGS]))
 
-        if FIELD_FILES in self.metadata:
-            output += u"\n----Files----\n\n"
-            for item in self.metadata[FIELD_FILES]:
-                filename = item[0]
-                output += u"{}\n".format(filename)
+        if FIELD_FILES in metadata:
+            parts.append(u"\n----Files----\n\n")
+            parts.extend(u"{}\n".format(item[0]) for item in metadata[FIELD_FILES])
 
-        if FIELD_DEBUG in self.metadata:
-            output += u"\n----Debug----\n\n"
-            for item in self.metadata[FIELD_DEBUG]:
-                output += u"{}\n".format(item)
+        if FIELD_DEBUG in metadata:
+            parts.append(u"\n----Debug----\n\n")
+            parts.extend(u"{}\n".format(item) for item in metadata[FIELD_DEBUG])
 
         if self.ida_log:
-            output += u"\n----IDA Log----\n\n"
-            output += u"{}\n".format(self.ida_log)
+            parts.append(u"\n----IDA Log----\n\n")
+            parts.append(u"{}\n".format(self.ida_log))
 
         if self.errors:
-            output += u"\n----Errors----\n\n"
-            for item in self.errors:
-                output += u"{}\n".format(item)
+            parts.append(u"\n----Errors----\n\n")
+            parts.extend(u"{}\n".format(item) for item in self.errors)
 
-        return output
+        return u"".join(parts)
 
     @contextlib.contextmanager
     def __redirect_stdout(self):
         """Redirects stdout temporarily while in a with statement."""
+        # Captured output only goes to debug logs, so don't bother capturing if nobody will see it.
+        if not logger.isEnabledFor(logging.DEBUG):
+            orig_stdout = sys.stdout
+            sys.stdout = _null_writer
+            try:
+                yield
+            finally:
+                sys.stdout = orig_stdout
+            return
+
         debug_stdout = io.StringIO()
         orig_stdout = sys.stdout
         sys.stdout = debug_stdout
         try:
             yield
         finally:
-            for line in debug_stdout.getvalue().splitlines():
-                logger.debug(line)
             sys.stdout = orig_stdout
+            if debug_stdout.tell():
+                debug_stdout.seek(0)
+                for line in debug_stdout:
+                    logger.debug(line.rstrip("\r\n"))
 
     def __reset(self):
         """
@@ -297,27 +584,32 @@ class Reporter(object):
         self._temp_file_name = ""
         self._managed_tempdir = ""
 
-        self.metadata = {}
+        self._metadata = {}
         self.errors = []
         self.ida_log = ""
+        self._files_by_name = {}
+        self._file_bytes_cache = collections.OrderedDict()
+        self._raw_files = {}
+        self._pending_b64 = []
+        self._strings_cursor = None
 
-        # To keep backwards compatibility, setup log handler to add errors and debug messages to reporter.
-        # TODO: Remove this when the Reporter object should no longer be responsible for logging.
-        log_handler = ReporterLogHandler(self)
-        logging.root.addHandler(log_handler)
-        # Setup a simple format that doesn't contain any runtime variables.
-        log_handler.addFilter(logutil.LevelCharFilter())
-        log_handler.setFormatter(logging.Formatter("[%(level_char)s] %(message)s"))
-        self._log_handler = log_handler
+        self._log_handler.reset()
+        logging.root.addHandler(self._log_handler)
+        self._log_handler_attached = True
 
     def __cleanup(self):
         """
         Cleanup things
         """
-        # Remove log handler.
-        if self._log_handler:
+        # Detach log handler.
+        if self._log_handler_attached:
             logging.root.removeHandler(self._log_handler)
-            self._log_handler = None
+            self._log_handler_attached = False
+
+        # Nothing else to do if we never created any temporary files.
+        if not self._needs_cleanup:
+            return
+        self._needs_cleanup = False
 
         # Delete temporary directory.
         if not self._disable_temp_cleanup:
@@ -339,4 +631,5 @@ class Reporter(object):
         self._managed_tempdir = ""
 
     def __del__(self):
-        self.__cleanup()
+        if self._needs_cleanup or self._log_handler_attached:
+            self.__cleanup()
@@ -9,17 +9,16 @@ Add any builtin functions that need to be handled below.  The function should be
 @builtin_func("memmove")
 @builtin_func("memcpy")
 def _memcpy(cpu_context, call_ip, func_name, func_args):
-    print "IN memmove or memcpy"
+    print("IN memmove or memcpy")
     return 1  # Return anything to be placed into rax (or equivalent)
 
 # Using a single function for a builtin
 @builtin_func
 def memmove(cpu_context, call_ip, func_name, func_args):
-    print "IN memmove"
+    print("IN memmove")
 
 """
 
-import six
 
 import logging
 from contextlib import contextmanager
@@ -158,8 +157,7 @@ def memchr(cpu_context, func_name, func_args):
     to it.
     """
     data_ptr, value, num = func_args
-    if six.PY2:
-        value = chr(value)
+    value = bytes([value & 0xFF])
 
     ptr = cpu_context.memory.find(value, start=data_ptr, end=data_ptr + num)
     if ptr == -1:
@@ -320,8 +318,6 @@ def strchr(cpu_context, func_name, func_args):
     """
     string_ptr, character = func_args
     string = cpu_context.read_data(string_ptr)
-    if six.PY2:
-        character = chr(character)
 
     if func_name == "strchr":
         offset = string.find(character)
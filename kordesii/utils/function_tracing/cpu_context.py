@@ -27,6 +27,27 @@ from kordesii.utils.function_tracing.functions import FunctionSignature
 logger = logging.getLogger(__name__)
 
 
+def decode_instruction(ip):
+    """
+    Decodes the information about the instruction at the given address needed to execute it.
+
+    :param int ip: instruction address
+
+    :return: tuple containing the mnemonic, the rep prefix type ("rep", "repe", "repne" or None)
+        and the address of the next instruction
+    """
+    rep = None
+    if idc.get_wide_byte(ip) in (0xF2, 0xF3):
+        insn = idc.GetDisasm(ip)  # IDA pro never has operands for rep opcodes.
+        if insn.startswith("rep "):
+            rep = "rep"
+        elif insn.startswith(("repe ", "repz ")):
+            rep = "repe"
+        elif insn.startswith(("repne ", "repnz ")):
+            rep = "repne"
+    return idc.print_insn_mnem(ip), rep, idc.next_head(ip)
+
+
 class JccContext(object):
     """
     Stores information pertaining to a Jcc instruction encountered when tracing.
@@ -194,33 +215,36 @@ class ProcessorContext(object):
         else:
             return None
 
-    def execute(self, ip=None):
+    def execute(self, ip=None, decoded=None):
         """
         "Execute" the instruction at IP and store results in the context.
         The RIP/EIP register will be set to the value supplied in IP so that it is
         correct.
 
         :param ip: instruction address to execute (defaults to currently set ip)
+        :param decoded: Decoded instruction at ip as returned by decode_instruction().
+            (Allows callers executing the same instructions repeatedly to only decode them once.)
         """
         if not ip:
             ip = self.ip
 
+        if decoded is None:
+            decoded = decode_instruction(ip)
+        mnem, rep, next_ip = decoded
+
         # Set instruction pointer to where we are currently executing.
         self.ip = ip
 
         # Determine if a rep* instruction and add termination condition.
         term_condition = None
-        if idc.get_wide_byte(ip) in (0xF2, 0xF3):
-            insn = idc.GetDisasm(ip)  # IDA pro never has operands for rep opcodes.
-            if insn.startswith("rep "):
-                term_condition = lambda: self.registers.ecx == 0
-            elif insn.startswith(("repe ", "repz ")):
-                term_condition = lambda: self.registers.ecx == 0 or self.registers.zf == 0
-            elif insn.startswith(("repne ", "repnz ")):
-                term_condition = lambda: self.registers.ecx == 0 or self.registers.zf == 1
+        if rep == "rep":
+            term_condition = lambda: self.registers.ecx == 0
+        elif rep == "repe":
+            term_condition = lambda: self.registers.ecx == 0 or self.registers.zf == 0
+        elif rep == "repne":
+            term_condition = lambda: self.registers.ecx == 0 or self.registers.zf == 1
 
         # Emulate instruction.
-        mnem = idc.print_insn_mnem(ip)
         operands = self.operands
         instruction = self.OPCODES.get(mnem)
         if instruction:
@@ -251,7 +275,7 @@ class ProcessorContext(object):
         # After execution, set instruction pointer to next instruction assuming
         # standard code flow and if no jump was made.
         if self.ip == ip:
-            self.ip = idc.next_head(ip)
+            self.ip = next_ip
 
     def get_call_history(self, func_name):
         """
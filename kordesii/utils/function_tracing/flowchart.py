@@ -4,6 +4,8 @@ functionality including Breadth-First and Depth-First chart traversal, locating
 chart based on an EA, generating a list of all possible paths to a specified EA, etc.
 """
 
+import bisect
+import collections
 import functools
 import logging
 from operator import attrgetter
@@ -12,12 +14,17 @@ from copy import copy, deepcopy
 import idaapi
 import idautils
 import idc
+import numpy
 
-from .cpu_context import ProcessorContext
+from .cpu_context import ProcessorContext, decode_instruction
 
 
 logger = logging.getLogger(__name__)
 
+# Sort keys for blocks. (Avoids going through CustomBasicBlock.__lt__ for each comparison.)
+_START_EA = attrgetter("start_ea")
+_START_END_EA = attrgetter("start_ea", "end_ea")
+
 
 class PathNode(object):
     """
@@ -25,7 +32,9 @@ class PathNode(object):
     object can also track cpu context up to a certain EA.
     """
 
-    _cache = {}
+    # Cache of recently used path nodes, bounded since each node may hold onto a cpu context.
+    _cache = collections.OrderedDict()
+    MAX_CACHE_SIZE = 1000
 
     def __init__(self, bb, prev):
         self.bb = bb
@@ -38,12 +47,16 @@ class PathNode(object):
     @classmethod
     def from_cache(cls, bb, prev):
         """Constructor that caches and reuses existing instances."""
+        key = (bb, prev)
         try:
-            return cls._cache[(bb, prev)]
+            path_node = cls._cache[key]
+            cls._cache.move_to_end(key)
         except KeyError:
             path_node = cls(bb, prev)
-            cls._cache[(bb, prev)] = path_node
-            return path_node
+            cls._cache[key] = path_node
+            if len(cls._cache) > cls.MAX_CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return path_node
 
     def __contains__(self, ea):
         return ea in self.bb
@@ -53,10 +66,13 @@ class PathNode(object):
 
     def path(self):
         """Returns a list of PathNode objects represented by the linked list."""
-        if self.prev:
-            return self.prev.path() + [self]
-        else:
-            return [self]
+        path = []
+        path_node = self
+        while path_node:
+            path.append(path_node)
+            path_node = path_node.prev
+        path.reverse()
+        return path
 
     def cpu_context(self, ea=None, init_context=None):
         """
@@ -107,8 +123,10 @@ class PathNode(object):
             if self._context_ea != end:
                 # Fill context up to requested ea.
                 logger.debug("Emulating instructions 0x{:08X} -> 0x{:08X}".format(self._context_ea, end))
-                for ip in idautils.Heads(self._context_ea, end):
-                    self._context.execute(ip)
+                for ip, decoded in self.bb.instructions(self._context_ea):
+                    if ip >= end:
+                        break
+                    self._context.execute(ip, decoded=decoded)
 
             self._context_ea = end
 
@@ -159,6 +177,14 @@ class CustomBasicBlock(idaapi.BasicBlock):
         - Iterator of paths leading to this block.
     """
 
+    # Successor/predecessor blocks and heads are cached after first request since they never change.
+    _succs = None
+    _preds = None
+    _succs_sorted = None
+    _preds_sorted = None
+    _heads = None
+    _decoded = None
+
     def __init__(self, id_or_ea, bb=None, fc=None):
         if bb is None and fc is None:
             temp_codeblock = _get_codeblock(id_or_ea)
@@ -173,7 +199,8 @@ class CustomBasicBlock(idaapi.BasicBlock):
         return "<CustomBasicBlock(start_ea=0x{:08X}, end_ea=0x{:08X})>".format(self.start_ea, self.end_ea)
 
     def __eq__(self, other):
-        return self.start_ea == other.start_ea
+        # Blocks are cached per flowchart, so identity is the common case.
+        return self is other or self.start_ea == other.start_ea
 
     def __lt__(self, other):
         return self.start_ea < other.start_ea
@@ -185,6 +212,32 @@ class CustomBasicBlock(idaapi.BasicBlock):
         """Length of block is the number of instructions contained within."""
         return len(list(self.heads()))
 
+    def succs(self):
+        """Iterates the successor blocks."""
+        if self._succs is None:
+            self._succs = tuple(super(CustomBasicBlock, self).succs())
+        return iter(self._succs)
+
+    def preds(self):
+        """Iterates the predecessor blocks."""
+        if self._preds is None:
+            self._preds = tuple(super(CustomBasicBlock, self).preds())
+        return iter(self._preds)
+
+    @property
+    def succs_sorted(self):
+        """Tuple of successor blocks sorted by start_ea."""
+        if self._succs_sorted is None:
+            self._succs_sorted = tuple(sorted(self.succs(), key=_START_EA))
+        return self._succs_sorted
+
+    @property
+    def preds_sorted(self):
+        """Tuple of predecessor blocks sorted by start_ea."""
+        if self._preds_sorted is None:
+            self._preds_sorted = tuple(sorted(self.preds(), key=_START_EA))
+        return self._preds_sorted
+
     def heads(self, start=None, reverse=False):
         """
         Iterates all the heads within the given block.
@@ -199,12 +252,42 @@ class CustomBasicBlock(idaapi.BasicBlock):
         if start and start not in self:
             raise ValueError("Start address 0x{:08X} is not in block: {!r}".format(start, self))
 
+        if self._heads is None:
+            self._heads = tuple(idautils.Heads(self.start_ea, self.end_ea))
+        heads = self._heads
+
+        # Walk the cached heads by index to avoid copying them.
         if reverse:
-            for head in reversed(list(idautils.Heads(self.start_ea, start or self.end_ea))):
-                yield head
+            index = bisect.bisect_left(heads, start) if start else len(heads)
+            for i in range(index - 1, -1, -1):
+                yield heads[i]
         else:
-            for head in idautils.Heads(start or self.start_ea, self.end_ea):
-                yield head
+            index = bisect.bisect_left(heads, start) if start else 0
+            for i in range(index, len(heads)):
+                yield heads[i]
+
+    def instructions(self, start=None):
+        """
+        Iterates the instructions within the given block along with their decoded information.
+        (Instructions are only decoded once, no matter how many contexts they are executed in.)
+
+        :param start: Start address (defaults to start_ea)
+
+        :yields: Tuple containing the instruction address and its decoded information
+            to be passed along to ProcessorContext.execute()
+
+        :raises ValueError: If given start address is not in block.
+        """
+        if start and start not in self:
+            raise ValueError("Start address 0x{:08X} is not in block: {!r}".format(start, self))
+
+        if self._decoded is None:
+            self._decoded = tuple(decode_instruction(ip) for ip in self.heads())
+        heads = self._heads
+        decoded = self._decoded
+
+        for i in range(bisect.bisect_left(heads, start) if start else 0, len(heads)):
+            yield heads[i], decoded[i]
 
     def paths(self, _visited=None):
         """
@@ -241,8 +324,23 @@ class FlowChart(idaapi.FlowChart):
 
     def __init__(self, f, bounds=None, flags=idaapi.FC_PREDS):
         self.f = idaapi.get_func(f)
+        self._flags = flags
+        self._blocks = {}
+        self._block_starts = None
+        self._block_bounds = None
+        self._sorted_blocks = None
+        self._block_order = None
         super(FlowChart, self).__init__(f=self.f, bounds=bounds, flags=flags)
 
+    def refresh(self):
+        """Refreshes the flow chart, discarding any cached blocks."""
+        super(FlowChart, self).refresh()
+        self._blocks.clear()
+        self._block_starts = None
+        self._block_bounds = None
+        self._sorted_blocks = None
+        self._block_order = None
+
     def _traverse(self, start_ea=None, dfs=False):
         """
         Blind traversal of the graph.
@@ -257,20 +355,27 @@ class FlowChart(idaapi.FlowChart):
         """
         # Set our flag to True if start_ea is none so we yield all blocks, else wait till we find the requested block
         block_found = start_ea is None
-        non_visited = [self[0]]
-        visited = set()
+        non_visited = collections.deque([self[0]])
+        # Visited/queued blocks are tracked by block id.
+        visited = bytearray(self.size)
+        queued = bytearray(self.size)
+        queued[self[0].id] = 1
         while non_visited:
-            cur_block = non_visited.pop(0)
-            if hash(cur_block) in visited:
+            cur_block = non_visited.popleft()
+            if visited[cur_block.id]:
                 continue
 
-            visited.add(hash(cur_block))
-            succs = sorted(cur_block.succs())
+            visited[cur_block.id] = 1
+            succs = cur_block.succs_sorted
             if dfs:
-                # [0:0] allows us to extend to the front
-                non_visited[0:0] = succs
+                # extendleft() pushes in reverse order, so reverse first to keep the sorted order at the front.
+                non_visited.extendleft(reversed(succs))
             else:
-                non_visited.extend(succs)
+                # Only queue each block once. (This doesn't affect the order of a breadth-first traversal.)
+                for succ in succs:
+                    if not queued[succ.id]:
+                        queued[succ.id] = 1
+                        non_visited.append(succ)
 
             if not block_found:
                 block_found = start_ea in cur_block
@@ -289,26 +394,35 @@ class FlowChart(idaapi.FlowChart):
         :yield: function block object
         """
         if start_ea:
-            non_visited = [self.find_block(start_ea)]
+            non_visited = collections.deque([self.find_block(start_ea)])
         else:
-            non_visited = list(sorted(self, key=attrgetter("start_ea")))[-1:]
-
-        visited = set()
+            non_visited = collections.deque(self._get_sorted_blocks()[-1:])
+
+        order = self._get_block_order()
+        # Visited/queued blocks are tracked by block id.
+        visited = bytearray(self.size)
+        queued = bytearray(self.size)
+        for block in non_visited:
+            queued[block.id] = 1
         while non_visited:
-            cur_block = non_visited.pop(0)
-            if hash(cur_block) in visited:
+            cur_block = non_visited.popleft()
+            if visited[cur_block.id]:
                 continue
 
-            visited.add(hash(cur_block))
+            visited[cur_block.id] = 1
 
-            preds = sorted(cur_block.preds(), reverse=True)
-            # For now, only consider predicates that are before the current block.
-            # This helps to prevent cyclic loops.
-            preds = [pred for pred in preds if pred < cur_block]
+            # Only consider predecessors that come before the current block in the function's topological order.
+            # This skips back edges in order to prevent cyclic loops.
+            cur_order = order[cur_block.id]
+            preds = [pred for pred in reversed(cur_block.preds_sorted) if order[pred.id] < cur_order]
             if dfs:
-                non_visited[0:0] = preds
+                non_visited.extendleft(reversed(preds))
             else:
-                non_visited.extend(preds)
+                # Only queue each block once. (This doesn't affect the order of a breadth-first traversal.)
+                for pred in preds:
+                    if not queued[pred.id]:
+                        queued[pred.id] = 1
+                        non_visited.append(pred)
 
             yield cur_block
 
@@ -349,6 +463,43 @@ class FlowChart(idaapi.FlowChart):
             for head in heads:
                 yield head
 
+    def _get_sorted_blocks(self):
+        """Obtains the list of blocks sorted by address. (Computed once and cached.)"""
+        if self._sorted_blocks is None:
+            # (Sorting by end_ea as well ensures empty blocks don't shadow a block starting at the same address.)
+            self._sorted_blocks = sorted(self, key=_START_END_EA)
+            self._block_starts = [block.start_ea for block in self._sorted_blocks]
+        return self._sorted_blocks
+
+    def _get_block_order(self):
+        """
+        Obtains the reverse postorder index of each block, indexed by block id. (Computed once and cached.)
+        Every edge that isn't a back edge leads from a lower index to a higher one.
+        """
+        if self._block_order is None:
+            order = [None] * self.size
+            postorder = []
+            # Start from the entry block, then pick up any blocks unreachable from it.
+            for root in [self[0]] + list(self):
+                if order[root.id] is not None:
+                    continue
+                order[root.id] = -1
+                stack = [(root, iter(root.succs_sorted))]
+                while stack:
+                    block, succs = stack[-1]
+                    for succ in succs:
+                        if order[succ.id] is None:
+                            order[succ.id] = -1
+                            stack.append((succ, iter(succ.succs_sorted)))
+                            break
+                    else:
+                        stack.pop()
+                        postorder.append(block)
+            for index, block in enumerate(reversed(postorder)):
+                order[block.id] = index
+            self._block_order = order
+        return self._block_order
+
     def find_block(self, ea):
         """
         Locate a BasicBlock which contains the specified ea
@@ -358,45 +509,42 @@ class FlowChart(idaapi.FlowChart):
         :return: CustomBasicBlock object or None if not found.
         :rtype: CustomBasicBlock
         """
-        for block in self:
+        sorted_blocks = self._get_sorted_blocks()
+
+        # Find the last block starting at or before ea.
+        index = bisect.bisect_right(self._block_starts, ea) - 1
+        if index >= 0:
+            block = sorted_blocks[index]
             if ea in block:
                 return block
 
-    def _paths_to_ea(self, ea, cur_block, visited=None, cur_path=None):
+    def find_blocks(self, eas):
         """
-        Recursive DFS traversal of graph which yields a path to EA.
+        Locate the BasicBlocks which contain each of the specified eas.
 
-        :param int ea: ea of interesting
-        :param CustomBasicBlock cur_block: current block in graph
-        :param set visited: set of blocks already visited
-        :param list cur_path: a list of blocks on the current path
+        :param eas: iterable of eas of interest
 
-        :yield list: current path
+        :return: list of CustomBasicBlock objects (or None if not found) corresponding to each ea.
+        :rtype: list
         """
-        cur_path = cur_path or []
-
-        # Initialize our visited set of blocks
-        if visited is None:
-            visited = set()
-
-        # Mark the current block as visited and add it to the current path
-        visited.add(cur_block.start_ea)
-        cur_path.append(cur_block)
-        # We've found our block, so yield the current path
-        if ea in cur_block:
-            yield copy(cur_path)
-
-        # Continue traversing
-        for block in cur_block.succs():
-            if block.start_ea in visited:
-                continue
-
-            for path in self._paths_to_ea(ea, block, visited, cur_path):
-                yield path
+        sorted_blocks = self._get_sorted_blocks()
+        eas = numpy.fromiter(eas, dtype=numpy.uint64)
+        if not sorted_blocks:
+            return [None] * len(eas)
+
+        if self._block_bounds is None:
+            self._block_bounds = (
+                numpy.array(self._block_starts, dtype=numpy.uint64),
+                numpy.array([block.end_ea for block in sorted_blocks], dtype=numpy.uint64),
+            )
+        starts, ends = self._block_bounds
 
-        # Remove the current block from the path and visited so it is included in subsequent paths
-        cur_path.pop()
-        visited.remove(cur_block.start_ea)
+        # Find the last block starting at or before each ea.
+        indices = numpy.searchsorted(starts, eas, side="right") - 1
+        found = (indices >= 0) & (eas < ends[indices])
+        return [
+            sorted_blocks[index] if is_found else None for index, is_found in zip(indices.tolist(), found.tolist())
+        ]
 
     def paths_to_ea(self, ea):
         """
@@ -411,8 +559,58 @@ class FlowChart(idaapi.FlowChart):
         if not (self.f.start_ea <= ea < self.f.end_ea):
             raise ValueError
 
-        for path in self._paths_to_ea(ea, self[0]):
-            yield path
+        target_block = self.find_block(ea)
+        if target_block is None:
+            return
+
+        # Only blocks which can reach the target block need to be traversed.
+        # (Requires predecessors to have been computed, otherwise all blocks are traversed.)
+        # (Blocks are tracked by block id.)
+        if self._flags & idaapi.FC_PREDS:
+            can_reach = bytearray(self.size)
+            can_reach[target_block.id] = 1
+            non_visited = collections.deque([target_block])
+            while non_visited:
+                for pred in non_visited.popleft().preds():
+                    if not can_reach[pred.id]:
+                        can_reach[pred.id] = 1
+                        non_visited.append(pred)
+        else:
+            can_reach = bytearray(b"\x01" * self.size)
+
+        # Iterative DFS traversal of the graph, keeping a stack of successor iterators for the current path.
+        start_block = self[0]
+        if not can_reach[start_block.id]:
+            return
+        cur_path = [start_block]
+        visited = bytearray(self.size)
+        visited[start_block.id] = 1
+        if ea in start_block:
+            yield copy(cur_path)
+            return
+        stack = [start_block.succs()]
+        while stack:
+            block = next(stack[-1], None)
+
+            # Once all successors are exhausted, remove the block from the path and visited
+            # so it is included in subsequent paths.
+            if block is None:
+                stack.pop()
+                visited[cur_path.pop().id] = 0
+                continue
+
+            if visited[block.id] or not can_reach[block.id]:
+                continue
+
+            visited[block.id] = 1
+            cur_path.append(block)
+            # We've found our block, so yield the current path
+            # (There is no need to continue past it since it can't be visited again.)
+            if ea in block:
+                yield copy(cur_path)
+                stack.append(iter(()))
+            else:
+                stack.append(block.succs())
 
     def get_paths(self, ea):
         """
@@ -446,5 +644,11 @@ class FlowChart(idaapi.FlowChart):
         """
         Override the idaapi.FlowChart._getitem function to return our CustomBasicBlock
         type instead.
+        (Blocks are cached so their successors and predecessors only need to be computed once.)
         """
-        return CustomBasicBlock(index, self._q[index], self)
+        try:
+            return self._blocks[index]
+        except KeyError:
+            block = CustomBasicBlock(index, self._q[index], self)
+            self._blocks[index] = block
+            return block
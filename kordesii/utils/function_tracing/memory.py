@@ -34,13 +34,18 @@ class PageMap(collections.defaultdict):
     def __init__(self, map_segments=True):
         # Setting default_factory to None, because we have overwritten it in __missing__()
         super(PageMap, self).__init__(None)
+        # Indexes of pages shared with a copy of this map, which must be copied before being modified.
+        self._shared = set()
         if map_segments:
             self.map_segments()
 
     def __deepcopy__(self, memo):
         copy = PageMap(map_segments=False)
         memo[id(self)] = copy
-        copy.update({index: (page[:] if page is not None else None) for index, page in self.items()})
+        # Pages are copied on write, so both maps can share the same pages until then.
+        copy.update(self)
+        self._shared = {index for index, page in self.items() if page is not None}
+        copy._shared = set(self._shared)
         return copy
 
     def __missing__(self, page_index):
@@ -64,6 +69,11 @@ class PageMap(collections.defaultdict):
         if page is None:
             return self.__missing__(page_index)
 
+        # If page is shared with a copy, make our own copy before it gets modified.
+        if page_index in self._shared:
+            self._shared.remove(page_index)
+            page = self[page_index] = page[:]
+
         return page
 
     def _is_delayed(self, page_index):
@@ -129,8 +139,9 @@ class PageMap(collections.defaultdict):
         :return: page
         :rtype: bytearray
         """
-        if page_index in self and not self._is_delayed(page_index):
-            return self[page_index]
+        page = self.get(page_index)
+        if page is not None:
+            return page
         return self._new_page(page_index)
 
 
@@ -2,8 +2,8 @@
 This file contains utility functions utilized throughout the function_tracing package.
 """
 
+import functools
 import logging
-import re
 import string
 import struct
 
@@ -14,6 +14,7 @@ import ida_typeinf
 import idaapi
 import idautils
 import idc
+import numpy
 
 from .exceptions import FunctionTracingError
 
@@ -33,15 +34,21 @@ def signed(n, bit_width):
 
     :return int: signed conversion
     """
-    if n >> (bit_width - 1):  # Is the hi-bit set?
-        return n - (1 << bit_width)
+    # Flip the hi-bit and subtract it back out. (This subtracts 2**bit_width only if the hi-bit was set.)
+    hi_bit = 1 << (bit_width - 1)
+    return ((n & ((hi_bit << 1) - 1)) ^ hi_bit) - hi_bit
 
-    return n
+
+# Bit position of the sign bit indexed by byte width.
+_SIGN_SHIFTS = tuple(8 * width - 1 for width in range(17))
 
 
 def sign_bit(value, width):
     """Returns the highest bit with given value and byte width."""
-    return (value >> ((8 * width) - 1)) & 0x1
+    try:
+        return (value >> _SIGN_SHIFTS[width]) & 0x1
+    except IndexError:
+        return (value >> ((8 * width) - 1)) & 0x1
 
 
 def sign_extend(value, orig_size, dest_size):
@@ -56,50 +63,41 @@ def sign_extend(value, orig_size, dest_size):
 
     :return: value, sign extended
     """
-    # Calculate the max value for orig and dest
     orig_max = get_mask(orig_size)
     dest_max = get_mask(dest_size)
-    # Calculate bit count to shift by
-    orig_shift = 8 * orig_size
-    dest_shift = 8 * dest_size
-    # Create the bit mask
-    masknumber = value & orig_max
-    msb = masknumber >> (orig_shift - 1)
-    # Perform the sign extension
-    if msb:
-        signextended = ((dest_max << orig_shift) | masknumber) & dest_max
-    else:
-        signextended = value & dest_max
-
-    return signextended
+    value &= orig_max
+    # Fill the upper bits with the sign bit without branching. (-1 is all 1's, -0 is all 0's)
+    sign_fill = -(value >> (8 * orig_size - 1)) & (dest_max ^ orig_max)
+    return (value | sign_fill) & dest_max
 
 
 def align_page_up(x):
     return (x + 0x1000 - 1) & ~(0x1000 - 1)
 
 
+# Byte width (BYTE, WORD, DWORD, QWORD, OWORD) indexed by the bit length of a value.
+_BYTE_WIDTHS = bytes([1] * 9 + [2] * 8 + [4] * 16 + [8] * 32 + [16] * 64)
+
+
 def get_byte_width(value):
     """
-    Calculate the appropriate byte width of the input value (BYTE, WORD, DWORD, QWORD)
+    Calculate the appropriate byte width of the input value (BYTE, WORD, DWORD, QWORD, OWORD)
 
     :param value: value to to determine width of
 
-    :return: bytes required to store data
+    :return: bytes required to store data or None if value is larger than 128 bits
     """
-    if value <= 0xFF:
+    if value < 0:
         return 1
 
-    if value <= 0xFFFF:
-        return 2
-
-    if value <= 0xFFFFFFFF:
-        return 4
-
-    if value <= 0xFFFFFFFFFFFFFFFF:
-        return 8
+    try:
+        return _BYTE_WIDTHS[value.bit_length()]
+    except IndexError:
+        return None
 
 
 BIG_ENDIAN = idaapi.cvar.inf.is_be()
+_BYTE_ORDER = "big" if BIG_ENDIAN else "little"
 
 # Table used by struct_unpack and struct_pack functions
 struct_unpack_table = {
@@ -111,19 +109,9 @@ struct_unpack_table = {
 }
 
 
-def _get_format_str(width, signed=False):
-    if width not in struct_unpack_table:
-        raise FunctionTracingError("Invalid width to unpack: {}".format(width))
-
-    format_char = struct_unpack_table[width]
-    if signed:
-        format_char = format_char.lower()
-    return ">" if BIG_ENDIAN else "<" + format_char
-
-
 def struct_unpack(buffer, signed=False):
     """
-    Unpack a buffer given its length and offset using struct.unpack().
+    Unpack a buffer given its length and offset using int.from_bytes().
     This function will know how to unpack the given buffer by using the lookup table 'struct_unpack_table'
     If the buffer is of unknown length then None is returned. Otherwise the unpacked value is returned.
 
@@ -133,18 +121,11 @@ def struct_unpack(buffer, signed=False):
     :return: unpacked int or None
     """
     n = len(buffer)
-    format_str = _get_format_str(n, signed)
+    if n not in struct_unpack_table:
+        raise FunctionTracingError("Invalid width to unpack: {}".format(n))
 
     # Unpack
-    if n == 16:
-        # Struct can only handle up to 64-bit values...so work in 64-bit chunks
-        a, b = struct.unpack(format_str, buffer)
-        if BIG_ENDIAN:
-            return (a << 64) | b
-        else:
-            return (b << 64) | a
-    else:
-        return struct.unpack(format_str, buffer)[0]
+    return int.from_bytes(buffer, _BYTE_ORDER, signed=signed)
 
 
 def struct_pack(value, width=None):
@@ -165,18 +146,49 @@ def struct_pack(value, width=None):
     # '\xaf\x8f\xda\xd4\xff\xff\xff\xff'
     # struct.pack("<Q", -723873873 & 0xFFFFFFFFFFFFFFFF)
     # '\xaf\x8f\xda\xd4\xff\xff\xff\xff'
-    format_str = _get_format_str(width, signed=False)
 
     # Pack
-    if width == 16:
-        # Struct can only handle up to 64-bit values... so work in 64-bit chunks
-        if BIG_ENDIAN:
-            return struct.pack(format_str, value >> 64, value & 0xFFFFFFFFFFFFFFFF)
-        else:
-            return struct.pack(format_str, value & 0xFFFFFFFFFFFFFFFF, value >> 64)
-    else:
-        # Need to mask off the size of value to width since pack doesn't truncate...
-        return struct.pack(format_str, (value & get_mask(width)))
+    if width not in struct_unpack_table:
+        raise FunctionTracingError("Invalid width to unpack: {}".format(width))
+    # Need to mask off the size of value to width since to_bytes() doesn't truncate...
+    return (value & _MASKS[width]).to_bytes(width, _BYTE_ORDER)
+
+
+# Numpy dtypes keyed by (width, signed) used by struct_unpack_many function.
+_dtypes = {
+    (width, signed): numpy.dtype((">" if BIG_ENDIAN else "<") + ("i" if signed else "u") + str(width))
+    for width in (1, 2, 4, 8)
+    for signed in (False, True)
+}
+
+
+def struct_unpack_many(buffer, width, signed=False, count=None):
+    """
+    Unpack a buffer as a sequence of values of the given width.
+
+    >>> struct_unpack_many(b"\x01\x00\x02\x00", 2)
+    array([1, 2], dtype=uint16)
+
+    :param buffer: data to be unpacked
+    :param width: width of each value (choose from 1, 2, 4, or 8 bytes)
+    :param signed: whether the data is a signed or unsigned value
+    :param count: number of values to unpack (defaults to all values in buffer)
+
+    :return: numpy array of unpacked values
+    :raises FunctionTracingError: If width is not supported.
+    """
+    try:
+        dtype = _dtypes[(width, signed)]
+    except KeyError:
+        raise FunctionTracingError("Invalid width to unpack: {}".format(width))
+    return numpy.frombuffer(buffer, dtype=dtype, count=-1 if count is None else count)
+
+
+# Precompiled (float, int) Struct pairs keyed by precision used by float_to_int and int_to_float functions.
+_float_structs = {
+    1: (struct.Struct("f"), struct.Struct("I")),
+    2: (struct.Struct("d"), struct.Struct("Q")),
+}
 
 
 def float_to_int(val, precision=2):
@@ -191,12 +203,11 @@ def float_to_int(val, precision=2):
     :return: int
     :raises: ValueError
     """
-    if precision == 1:
-        return struct.unpack("H", struct.pack("f", val))[0]
-    elif precision == 2:
-        return struct.unpack("Q", struct.pack("d", val))[0]
-    else:
+    try:
+        float_struct, int_struct = _float_structs[precision]
+    except KeyError:
         raise FunctionTracingError("Precision {} is not valid.".format(precision))
+    return int_struct.unpack(float_struct.pack(val))[0]
 
 
 def int_to_float(val, precision=2):
@@ -211,12 +222,15 @@ def int_to_float(val, precision=2):
     :return: int or None
     :raises: ValueError
     """
-    if precision == 1:
-        return struct.unpack("f", struct.pack("H", val))[0]
-    elif precision == 2:
-        return struct.unpack("d", struct.pack("Q", val))[0]
-    else:
+    try:
+        float_struct, int_struct = _float_structs[precision]
+    except KeyError:
         raise FunctionTracingError("Precision {} is not valid.".format(precision))
+    return float_struct.unpack(int_struct.pack(val))[0]
+
+
+# Precomputed masks for byte sizes 0 through 16.
+_MASKS = tuple((1 << (8 * size)) - 1 for size in range(17))
 
 
 def get_mask(size):
@@ -227,7 +241,10 @@ def get_mask(size):
 
     :return: mask of width size
     """
-    return 2 ** (8 * size) - 1
+    try:
+        return _MASKS[size]
+    except IndexError:
+        return (1 << (8 * size)) - 1
 
 
 def get_bits():
@@ -246,8 +263,81 @@ def get_bits():
     return result
 
 
-# Cache of function types we have computed.
-_func_types = set()
+# Characters allowed in a function declaration obtained from the decompiler.
+_DECL_CHARS = frozenset(string.printable) - {"\t", "!"}
+
+# Cache of function type information we have computed keyed by offset.
+# Each entry contains the function's type at the time and either the obtained tinfo_t object or an error message.
+_func_data_cache = {}
+
+
+def _get_function_tinfo(offset, func_type):
+    """
+    Obtain a tinfo_t object for the function with the provided start EA, setting the type if necessary.
+
+    :param int offset: start EA of function
+    :param str func_type: currently set type for the function
+
+    :return: ida_typeinf.tinfo_t object
+
+    :raise RuntimeError: if tinfo_t object cannot be obtained
+    """
+    tif = ida_typeinf.tinfo_t()
+
+    # Try to use the Hexrays decompiler to determine function signature.
+    # (It's better than IDA's guess_type)
+
+    try:
+        # This requires Hexrays decompiler, load it and make sure it's available before continuing.
+        if not idaapi.init_hexrays_plugin():
+            idc.load_and_run_plugin("hexrays", 0) or idc.load_and_run_plugin("hexx64", 0)
+        if not idaapi.init_hexrays_plugin():
+            raise RuntimeError("Unable to load Hexrays decompiler.")
+
+        # Pull type from decompiled C code.
+        try:
+            decompiled = idaapi.decompile(offset)
+        except idaapi.DecompilationFailure:
+            decompiled = None
+        if decompiled is None:
+            raise RuntimeError("Cannot decompile function at 0x{:X}".format(offset))
+        decompiled.get_func_type(tif)
+
+        # Save type for next time.
+        fmt = decompiled.print_dcl()
+        fmt = "".join(c for c in fmt if c in _DECL_CHARS)
+        # The 2's remove the unknown bytes always found at the start and end.
+        set_type_result = idc.SetType(offset, "{};".format(fmt))
+        if not set_type_result:
+            logger.warning("Failed to SetType for function at 0x{:X} with decompiler type {!r}".format(offset, fmt))
+
+    # If we fail, resort to using guess_type+
+    except RuntimeError:
+        if func_type:
+            # If IDA's disassembler set it already, go with that.
+            ida_nalt.get_tinfo(tif, offset)
+        else:
+            # Otherwise try to pull it from guess_type()
+            guessed_type = idc.guess_type(offset)
+            if guessed_type is None:
+                raise RuntimeError("failed to guess function type for offset 0x{:X}".format(offset))
+
+            func_name = idc.get_func_name(offset)
+            if func_name is None:
+                raise RuntimeError("failed to get function name for offset 0x{:X}".format(offset))
+
+            # Documentation states the type must be ';' terminated, also the function name must be inserted
+            guessed_type = "{};".format(guessed_type).replace("(", " {}(".format(func_name), 1)
+            set_type_result = idc.SetType(offset, guessed_type)
+            if not set_type_result:
+                logger.warning(
+                    "Failed to SetType for function at 0x{:X} with guessed type {!r}".format(offset, guessed_type)
+                )
+            # Try one more time to get the tinfo_t object
+            if not ida_nalt.get_tinfo(tif, offset):
+                raise RuntimeError("failed to obtain tinfo_t object for offset 0x{:X}".format(offset))
+
+    return tif
 
 
 def get_function_data(offset):
@@ -260,103 +350,103 @@ def get_function_data(offset):
 
     :raise RuntimeError: if func_type_data_t object cannot be obtained
     """
-    global _func_types
-
-    tif = ida_typeinf.tinfo_t()
-
     try:
         func_type = idc.get_type(offset)
     except TypeError:
         raise RuntimeError("Not a valid offset: {!r}".format(offset))
 
-    # First see if it's a type we already set before.
-    if func_type and offset in _func_types:
-        ida_nalt.get_tinfo(tif, offset)
+    funcdata = ida_typeinf.func_type_data_t()
 
-    else:
-        # Otherwise, try to use the Hexrays decompiler to determine function signature.
-        # (It's better than IDA's guess_type)
+    # First see if we already processed this function and its type hasn't changed since.
+    entry = _func_data_cache.get(offset)
+    if entry and entry[0] == func_type:
+        tif = entry[1]
+        if isinstance(tif, str):
+            raise RuntimeError(tif)
+        tif.get_func_details(funcdata)
+        return funcdata
 
-        try:
-            # This requires Hexrays decompiler, load it and make sure it's available before continuing.
-            if not idaapi.init_hexrays_plugin():
-                idc.load_and_run_plugin("hexrays", 0) or idc.load_and_run_plugin("hexx64", 0)
-            if not idaapi.init_hexrays_plugin():
-                raise RuntimeError("Unable to load Hexrays decompiler.")
-
-            # Pull type from decompiled C code.
-            try:
-                decompiled = idaapi.decompile(offset)
-            except idaapi.DecompilationFailure:
-                decompiled = None
-            if decompiled is None:
-                raise RuntimeError("Cannot decompile function at 0x{:X}".format(offset))
-            decompiled.get_func_type(tif)
-
-            # Save type for next time.
-            fmt = decompiled.print_dcl()
-            fmt = "".join(c for c in fmt if c in string.printable and c not in ("\t", "!"))
-            # The 2's remove the unknown bytes always found at the start and end.
-            set_type_result = idc.SetType(offset, "{};".format(fmt))
-            if not set_type_result:
-                logger.warning("Failed to SetType for function at 0x{:X} with decompiler type {!r}".format(offset, fmt))
-
-        # If we fail, resort to using guess_type+
-        except RuntimeError:
-            if func_type:
-                # If IDA's disassembler set it already, go with that.
-                ida_nalt.get_tinfo(tif, offset)
-            else:
-                # Otherwise try to pull it from guess_type()
-                guessed_type = idc.guess_type(offset)
-                if guessed_type is None:
-                    raise RuntimeError("failed to guess function type for offset 0x{:X}".format(offset))
-
-                func_name = idc.get_func_name(offset)
-                if func_name is None:
-                    raise RuntimeError("failed to get function name for offset 0x{:X}".format(offset))
-
-                # Documentation states the type must be ';' terminated, also the function name must be inserted
-                guessed_type = re.sub(r"\(", " {}(".format(func_name), "{};".format(guessed_type))
-                set_type_result = idc.SetType(offset, guessed_type)
-                if not set_type_result:
-                    logger.warning(
-                        "Failed to SetType for function at 0x{:X} with guessed type {!r}".format(offset, guessed_type)
-                    )
-                # Try one more time to get the tinfo_t object
-                if not ida_nalt.get_tinfo(tif, offset):
-                    raise RuntimeError("failed to obtain tinfo_t object for offset 0x{:X}".format(offset))
+    try:
+        if entry and func_type:
+            # Type was changed since we last processed this function (e.g. FunctionSignature.apply()), go with that.
+            tif = ida_typeinf.tinfo_t()
+            ida_nalt.get_tinfo(tif, offset)
+        else:
+            tif = _get_function_tinfo(offset, func_type)
 
-    funcdata = ida_typeinf.func_type_data_t()
-    if not tif.get_func_details(funcdata):
-        raise RuntimeError("failed to obtain func_type_data_t object for offset 0x{:X}".format(offset))
+        if not tif.get_func_details(funcdata):
+            raise RuntimeError("failed to obtain func_type_data_t object for offset 0x{:X}".format(offset))
+    except RuntimeError as e:
+        _func_data_cache[offset] = (idc.get_type(offset), str(e))
+        raise
 
-    # record that we have processed this function before.
-    _func_types.add(offset)
+    # Record the type we have computed for next time.
+    _func_data_cache[offset] = (idc.get_type(offset), tif)
 
     return funcdata
 
 
-def get_function_name(func_ea):
-    """Retrieves the function name from the given address."""
-    # (Using get_name() over get_func_name() so it also works for imported functions)
-    func_name = idc.get_name(func_ea)
-    # Demangle name if necessary:
-    demangled_name = idc.demangle_name(func_name, idc.get_inf_attr(idc.INF_SHORT_DN))
+@functools.lru_cache(maxsize=4096)
+def _demangle_function_name(func_name, disable_mask):
+    """Demangles given function name, stripping off everything but the name itself."""
+    demangled_name = idc.demangle_name(func_name, disable_mask)
     if demangled_name:
         # Strip off the extra junk: 'operator new(uint)' -> 'new'
-        match = re.search("([^ :]*)\(", demangled_name)
-        if not match:
+        head, paren, _ = demangled_name.partition("(")
+        if not paren:
             logger.debug("Unable to demangle function name: {}".format(demangled_name))
         else:
-            logger.debug("Demangled function name {} -> {}".format(demangled_name, match.group(1)))
-            demangled_name = match.group(1)
+            short_name = head.rsplit(" ", 1)[-1].rsplit(":", 1)[-1]
+            logger.debug("Demangled function name {} -> {}".format(demangled_name, short_name))
+            demangled_name = short_name
         func_name = demangled_name
     return func_name
 
 
+def get_function_name(func_ea):
+    """Retrieves the function name from the given address."""
+    # (Using get_name() over get_func_name() so it also works for imported functions)
+    func_name = idc.get_name(func_ea)
+    # Demangle name if necessary:
+    return _demangle_function_name(func_name, idc.get_inf_attr(idc.INF_SHORT_DN))
+
+
+# Cache of is_func_ptr() results keyed by offset.
+# Each entry contains the type at the offset at the time and the result.
+_is_func_ptr_cache = {}
+
+
 def is_func_ptr(offset):
     """Returns true if the given offset is a function pointer."""
+    try:
+        # Quickly reject anything that isn't even within the input file.
+        # (Checked on each call since segments could be added during analysis.)
+        if not idc.get_inf_attr(idc.INF_MIN_EA) <= offset < idc.get_inf_attr(idc.INF_MAX_EA):
+            return False
+        func_type = idc.get_type(offset)
+    except TypeError:
+        return False
+
+    entry = _is_func_ptr_cache.get(offset)
+    if entry and entry[0] == func_type:
+        return entry[1]
+
+    result = _is_func_ptr(offset)
+    _is_func_ptr_cache[offset] = (idc.get_type(offset), result)
+    return result
+
+
+def clear_cache():
+    """
+    Clears the internal cache of function type information used by get_function_data() and is_func_ptr().
+    Calling this will be necessary if functions or types have changed in a way that doesn't change the type
+    string of the function. (e.g. changing a function's boundaries or its name)
+    """
+    _func_data_cache.clear()
+    _is_func_ptr_cache.clear()
+
+
+def _is_func_ptr(offset):
     # Sometimes we will get a really strange issue where the IDA disassember has set a type for an
     # address that should not have been set during our course of emulation.
     # Therefore, before attempting to use get_function_data() to test if it's a function pointer,
@@ -379,6 +469,29 @@ def is_func_ptr(offset):
         raise FunctionTracingError("Failed to retrieve function data from {!r}: {}".format(offset, e))
 
 
+# Whether the input file uses 64-bit addressing.
+_EA64 = bool(idc.__EA64__)
+
+# Default register width used by reg2str()
+_DEFAULT_REG_WIDTH = 8 if _EA64 else 4
+
+# Register indexes used when decoding 16-bit addressing.
+_R_BX = ida_idp.str2reg("RBX")
+_R_BP = ida_idp.str2reg("RBP")
+_R_SI = ida_idp.str2reg("RSI")
+_R_DI = ida_idp.str2reg("RDI")
+_R_SP = idautils.procregs.sp.reg
+
+# 16-bit base and index registers indexed by operand phrase:
+# [BX+SI], [BX+DI], [BP+SI], [BP+DI], [SI], [DI], [BP], [BX]
+_X86_16_BASE = (_R_BX, _R_BX, _R_BP, _R_BP, _R_SI, _R_DI, _R_BP, _R_BX)
+_X86_16_INDEX = (_R_SI, _R_DI, _R_SI, _R_DI, -1, -1, -1, -1)
+
+# Bit width of the input file.
+_BITS = get_bits()
+
+
+@functools.lru_cache(maxsize=None)
 def convert_reg(reg_name, width):
     """Convert given register name to the register name for the provided width (eg: conver_reg(eax, 8) -> rax)"""
     reg_idx = ida_idp.str2reg(reg_name)
@@ -388,11 +501,10 @@ def convert_reg(reg_name, width):
     return ida_idp.get_reg_name(reg_idx, width)
 
 
+@functools.lru_cache(maxsize=None)
 def reg2str(register, width=None):
     """Convert given register index to the register name with the provided width (eg: reg2str(0, 8) -> rax)"""
-    if not width:
-        width = 8 if idc.__EA64__ else 4
-    return ida_idp.get_reg_name(register, width)
+    return ida_idp.get_reg_name(register, width or _DEFAULT_REG_WIDTH)
 
 
 ## The following functions are ports from the Hex-Rays SDK.  Unfortunately, much of the information found online
@@ -400,9 +512,8 @@ def reg2str(register, width=None):
 ## isn't exposed to Python...
 
 
-def insn_jcc(insn):
-    """Determine if an instruction is a Jcc (jump) instruction"""
-    return insn.itype in (
+_JCC_ITYPES = frozenset(
+    {
         ida_allins.NN_ja,
         ida_allins.NN_jae,
         ida_allins.NN_jb,
@@ -433,15 +544,12 @@ def insn_jcc(insn):
         ida_allins.NN_jpo,
         ida_allins.NN_js,
         ida_allins.NN_jz,
-    )
+    }
+)
 
 
-def insn_default_opsize_64(insn):
-    """Determine, based on the instruction type, if the instruction, by default, is 64-bit"""
-    if insn_jcc(insn):
-        return True
-
-    return insn.itype in (
+_DEFAULT_OPSIZE_64_ITYPES = frozenset(
+    {
         # use ss
         ida_allins.NN_pop,
         ida_allins.NN_popf,
@@ -473,34 +581,62 @@ def insn_default_opsize_64(insn):
         ida_allins.NN_loopqe,
         ida_allins.NN_loopne,
         ida_allins.NN_loopqne,
-    )
+    }
+)
+
+
+def insn_jcc(insn):
+    """Determine if an instruction is a Jcc (jump) instruction"""
+    return insn.itype in _JCC_ITYPES
+
+
+def insn_default_opsize_64(insn):
+    """Determine, based on the instruction type, if the instruction, by default, is 64-bit"""
+    itype = insn.itype
+    return itype in _JCC_ITYPES or itype in _DEFAULT_OPSIZE_64_ITYPES
+
+
+# insn_t.auxpref flags
+_AUX_USE32 = 0x00000008  # segment is 32-bit
+_AUX_USE64 = 0x00000010  # segment is 64-bit
+_AUX_NATOP = 0x00000800  # operand size prefix (66) is present
+_AUX_NATAD = 0x00001000  # address size prefix (67) is present
+_AUX_ADDR_MASK = _AUX_USE32 | _AUX_USE64 | _AUX_NATAD
+_AUX_OP_MASK = _AUX_USE32 | _AUX_USE64 | _AUX_NATOP
+
+# insn_t.insnpref flags
+_REX_B = 1
+_REX_X = 2
+_REX_W = 8
 
 
 def ad16(insn):
     """Determine if the current addressing is 16-bit"""
-    p = insn.auxpref & (0x00000008 | 0x00000010 | 0x00001000)
-    return p == 0x00001000 or p == 0x00000008
+    p = insn.auxpref & _AUX_ADDR_MASK
+    return p == _AUX_NATAD or p == _AUX_USE32
 
 
 def op16(insn):
     """Determine if the current operand size is 32-bit"""
-    p = insn.auxpref & (0x00000008 | 0x00000010 | 0x00000800)
-    return p == 0x00000800 or p == 0x00000008 or p == 0x00000010 and (insn.insnpref & 8) == 0
+    p = insn.auxpref & _AUX_OP_MASK
+    return p == _AUX_NATOP or p == _AUX_USE32 or p == _AUX_USE64 and not insn.insnpref & _REX_W
 
 
 def op32(insn):
     """Determine if the current operand size is 32-bit"""
-    p = insn.auxpref & (0x00000008 | 0x00000010 | 0x00000800)
-    return p == 0 or p == (0x00000008 | 0x00000800) or p == (0x00000010 | 0x00000800) and (insn.insnpref & 8) == 0
+    p = insn.auxpref & _AUX_OP_MASK
+    return p == 0 or p == _AUX_USE32 | _AUX_NATOP or p == _AUX_USE64 | _AUX_NATOP and not insn.insnpref & _REX_W
 
 
 def op64(insn):
     """Determine if the current operand size is 64-bit"""
-    if not idc.__EA64__:
+    if not _EA64:
         return False
 
-    return (insn.auxpref & 0x00000010) != 0 and (
-        (insn.insnpref & 8) != 0 or (insn.auxpref & 0x00000800) != 0 and insn_default_opsize_64(insn)
+    auxpref = insn.auxpref
+    return bool(
+        auxpref & _AUX_USE64
+        and (insn.insnpref & _REX_W or auxpref & _AUX_NATOP and insn_default_opsize_64(insn))
     )
 
 
@@ -513,7 +649,7 @@ def sib_base(insn, op):
     """Calculate the base register number for a phrase/displacment"""
     sib = op.specflag2  # specflag2 holds the SIB if there is one
     base = sib & 7
-    if idc.__EA64__ and (insn.insnpref & 1):  # Do we need to convert the base to a 64-bit register number?
+    if _EA64 and (insn.insnpref & _REX_B):  # Do we need to convert the base to a 64-bit register number?
         base |= 8  # Upconvert to 64-bit register number if not already
 
     return base
@@ -523,7 +659,7 @@ def sib_index(insn, op):
     """Calculate the index register number for a phrase/displacement"""
     sib = op.specflag2  # specflag2 holds the SIB if there is one
     index = (sib >> 3) & 7
-    if idc.__EA64__ and (insn.insnpref & 2):  # Do we need to conver the index to a 64-bit register number?
+    if _EA64 and (insn.insnpref & _REX_X):  # Do we need to conver the index to a 64-bit register number?
         index |= 8  # Upconvert to 64-bit register number if not already
 
     return index
@@ -542,22 +678,13 @@ def x86_base_reg(insn, op):
     if not ad16(insn):
         return op.phrase  # "phrase" contains the base register number
 
-    if signed(op.phrase, get_bits()) == -1:
-        return idautils.procregs.sp.reg  # return "*SP" register number (4)
-
-    if op.phrase in (0, 1, 7):  # ([BX+SI], [BX+DI], [BX])
-        return ida_idp.str2reg("RBX")  # All versions of *BX return 3
-
-    if op.phrase in (2, 3, 6):  # ([BP+SI], [BP+DI], [BP])
-        return ida_idp.str2reg("RBP")  # All versions of *BP return 5
+    if signed(op.phrase, _BITS) == -1:
+        return _R_SP  # return "*SP" register number (4)
 
-    if op.phrase == 4:  # [SI]
-        return ida_idp.str2reg("RSI")
-
-    if op.phrase == 5:  # [DI]
-        return ida_idp.str2reg("RDI")
-
-    raise ValueError("Unable to parse x86 base register from instruction")
+    try:
+        return _X86_16_BASE[op.phrase]
+    except IndexError:
+        raise ValueError("Unable to parse x86 base register from instruction")
 
 
 def x86_index_reg(insn, op):
@@ -572,13 +699,7 @@ def x86_index_reg(insn, op):
     if not ad16(insn):
         return -1
 
-    if op.phrase in (0, 2):  # ([BX+SI], [BP+SI])
-        return ida_idp.str2reg("RSI")
-
-    if op.phrase in (1, 3):  # ([BX+DI], [BP+DI])
-        return ida_idp.str2reg("RDI")
-
-    if op.phrase in (4, 5, 6, 7):  # ([SI], [DI], [BP], [BX])
-        return -1
-
-    raise ValueError("Unable to parse x86 index register from instruction")
+    try:
+        return _X86_16_INDEX[op.phrase]
+    except IndexError:
+        raise ValueError("Unable to parse x86 index register from instruction")
@@ -231,6 +231,8 @@ class Variable(object):
                 else:
                     # If data size is greater than type size, then we have an array.
                     data = self.data
+                    if data_type_size <= 8 and len(data) % data_type_size == 0:
+                        return utils.struct_unpack_many(data, data_type_size).tolist()
                     return [
                         utils.struct_unpack(data[i : i + data_type_size]) for i in range(0, len(data), data_type_size)
                     ]
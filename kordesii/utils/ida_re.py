@@ -17,6 +17,7 @@ usage::
 
 from __future__ import absolute_import
 
+import functools
 import re
 
 import idautils
@@ -25,6 +26,10 @@ import ida_segment
 from kordesii.utils import segments
 
 
+# Compiled patterns are cached so recurring scans with the same patterns don't recompile them.
+_compile = functools.lru_cache(maxsize=256)(re.compile)
+
+
 class Match(object):
     """
     Wraps the SRE_Match object returned by re.
@@ -77,8 +82,11 @@ class Pattern(object):
     """
 
     def __init__(self, ptn, flags=0):
-        if isinstance(ptn, (str, bytes)):
-            self._re = re.compile(ptn, flags=flags)
+        # Segment data is bytes, so text patterns must be converted to bytes to be able to match.
+        if isinstance(ptn, str):
+            ptn = ptn.encode("latin1")
+        if isinstance(ptn, bytes):
+            self._re = _compile(ptn, flags)
         else:
             self._re = ptn
 
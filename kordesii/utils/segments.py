@@ -2,13 +2,20 @@
 Utility for interfacing with segments more efficiently.
 """
 
+import collections
 import numbers
 
 import ida_bytes
 import ida_segment
 import idc
+import numpy
 
-_cache = {}
+# Maximum number of segment bytes to keep cached.
+# (Least recently used segments are evicted first. The most recently used segment is always kept.)
+MAX_CACHE_SIZE = 256 * 1024 * 1024
+
+_cache = collections.OrderedDict()
+_cache_size = 0
 
 
 def get_start(name_or_addr):
@@ -37,10 +44,16 @@ def _obtain_bytes(start, end):
 
     :return bytes: bytes contained within range
     """
-    # Reconstruct the segment, account for bytes which are not loaded.
-    # Can't use xrange() here because we can get a "Python int too large to conver to C long" error
-    bytes_range = range(start, end)  # a range from start -> end
-    return bytes(bytearray(ida_bytes.get_wide_byte(i) if idc.is_loaded(i) else 0 for i in bytes_range))
+    size = end - start
+    # Read the whole range at once along with the bitmap of which bytes are loaded.
+    result = ida_bytes.get_bytes_and_mask(start, size)
+    if not result:
+        return bytes(size)
+    data, mask = result
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+    loaded = numpy.unpackbits(numpy.frombuffer(mask, dtype=numpy.uint8), count=len(data), bitorder="little")
+    # Zero out the bytes which are not loaded, padding out a short read.
+    return (data * loaded).tobytes().ljust(size, b"\x00")
 
 
 def get_bytes(name_or_addr):
@@ -52,12 +65,19 @@ def get_bytes(name_or_addr):
 
     :return bytes: bytes which are contained with the segment
     """
+    global _cache_size
     seg_start = get_start(name_or_addr)
     seg_bytes = _cache.get(seg_start)
     if seg_bytes is None:
         seg_end = idc.get_segm_attr(seg_start, idc.SEGATTR_END)
         seg_bytes = _obtain_bytes(seg_start, seg_end)
         _cache[seg_start] = seg_bytes
+        _cache_size += len(seg_bytes)
+        while _cache_size > MAX_CACHE_SIZE and len(_cache) > 1:
+            _, evicted = _cache.popitem(last=False)
+            _cache_size -= len(evicted)
+    else:
+        _cache.move_to_end(seg_start)
 
     return seg_bytes
 
@@ -67,5 +87,6 @@ def clear_cache():
     Clears the internal cache of segment bytes.
     Calling this will be necessary if you have patched in new bytes into the IDB.
     """
-    global _cache
-    _cache = {}
+    global _cache, _cache_size
+    _cache = collections.OrderedDict()
+    _cache_size = 0
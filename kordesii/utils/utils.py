@@ -11,7 +11,6 @@ from typing import Union, List
 import re
 import logging
 
-import idaapi
 import ida_bytes
 import ida_entry
 import ida_funcs
@@ -25,6 +24,91 @@ logger = logging.getLogger(__name__)
 
 READ_LENGTH = 65536
 
+# Cache of import entries for each import module. (see _get_imports())
+_import_cache = None
+# Cache of thunk wrapper functions for each import entry. (see _get_thunks())
+_thunk_cache = {}
+# Cache of exports. (see iter_exports())
+_export_cache = None
+# Cache of export addresses keyed by name. (see get_export_addr())
+_export_addrs = None
+
+
+def _get_imports():
+    """
+    Obtains the import entries of each import module.
+    Enumerating the imports is computed once and cached.
+
+    :return: list of (module_name, [(ea, api_name), ...])
+    """
+    global _import_cache
+    if _import_cache is not None:
+        return _import_cache
+
+    entries = []
+
+    def callback(ea, name, ordinal):
+        if name:
+            # Sometimes IDA includes "__imp_" to the front of the name.
+            # Strip this off to be more consistent to what you would see in the GUI.
+            if name.startswith("__imp_"):
+                name = name[6:]
+            entries.append((ea, name))
+        return True  # continue enumeration
+
+    imports = []
+    for i in range(ida_nalt.get_import_module_qty()):
+        module_name = ida_nalt.get_import_module_name(i)
+        if not module_name:
+            continue
+
+        # (The callback is shared by all modules, so the entries list is reset each time.)
+        del entries[:]
+        ida_nalt.enum_import_names(i, callback)
+        imports.append((module_name, tuple(entries)))
+
+    _import_cache = imports
+    return imports
+
+
+def _get_thunks(ea):
+    """
+    Obtains the thunk wrapper functions for the given import entry.
+    Thunks are only looked up when first requested and then cached.
+
+    :param ea: Address of import entry.
+
+    :return: tuple of thunk function addresses
+    """
+    try:
+        return _thunk_cache[ea]
+    except KeyError:
+        pass
+
+    thunk_eas = []
+    for xref in idautils.XrefsTo(ea):
+        func = ida_funcs.get_func(xref.frm)
+        if func and func.flags & ida_funcs.FUNC_THUNK:
+            thunk_eas.append(xref.frm)
+    thunk_eas = _thunk_cache[ea] = tuple(thunk_eas)
+    return thunk_eas
+
+
+def clear_cache():
+    """
+    Clears the internal cache of imports and exports as well as the function information cached by function_tracing.
+    Calling this will be necessary if imports, exports, or functions have changed since the first lookup.
+    """
+    # Imported here so function_tracing is only loaded when needed.
+    from kordesii.utils.function_tracing import utils as function_tracing_utils
+
+    global _import_cache, _export_cache, _export_addrs
+    _import_cache = None
+    _export_cache = None
+    _export_addrs = None
+    _thunk_cache.clear()
+    function_tracing_utils.clear_cache()
+
 
 def iter_imports(module_name=None, api_names=None):
     """
@@ -60,48 +144,35 @@ def iter_imports(module_name=None, api_names=None):
     if isinstance(api_names, str):
         api_names = [api_names]
 
-    for i in range(ida_nalt.get_import_module_qty()):
-        _module_name = ida_nalt.get_import_module_name(i)
-        if not _module_name:
-            continue
-        if module_name and module_name.lower() != _module_name.lower():
-            continue
-
-        entries = []
-        target_set = set(api_names) if api_names else None
+    if module_name:
+        module_name = module_name.lower()
 
-        def callback(ea, name, ordinal):
-            if name:
-                # Sometimes IDA includes "__imp_" to the front of the name.
-                # Strip this off to be more consistent to what you would see in the GUI.
-                if name.startswith("__imp_"):
-                    name = name[6:]
+    for _module_name, entries in _get_imports():
+        if module_name and module_name != _module_name.lower():
+            continue
 
-                # Collect name if matches filter or if no filter set.
-                if target_set and (
+        if api_names:
+            # Collect entries which match the filter.
+            target_set = set(api_names)
+            matched_entries = []
+            for entry in entries:
+                name = entry[1]
+                if (
                     name in target_set
                     or name.strip("_") in target_set
                     or any(re.match("_*{}_+[0-9]?".format(name_), name) for name_ in target_set)
                 ):
-                    entries.append((ea, name))
+                    matched_entries.append(entry)
                     target_set.difference_update({name, name.strip("_")})
                     if not target_set:
-                        # Found all targeted function names. stop enumeration.
-                        return False
-                elif not api_names:
-                    entries.append((ea, name))
-            return True  # continue enumeration
-
-        ida_nalt.enum_import_names(i, callback)
+                        # Found all targeted function names.
+                        break
+            entries = matched_entries
 
         for ea, name in entries:
             # Yield thunk wrapper functions if they exists.
-            for xref in idautils.XrefsTo(ea):
-                func = ida_funcs.get_func(xref.frm)
-                if not func:
-                    continue
-                if func.flags & ida_funcs.FUNC_THUNK:
-                    yield xref.frm, name, _module_name
+            for thunk_ea in _get_thunks(ea):
+                yield thunk_ea, name, _module_name
 
             # Yield reference in data segment signature
             # (yielding after thunks, since those are more likely to be used)
@@ -114,17 +185,19 @@ def iter_exports():
 
     :yield: (ea, name)
     """
-    for i in range(ida_entry.get_entry_qty()):
-        ordinal = ida_entry.get_entry_ordinal(i)
-        ea = ida_entry.get_entry(ordinal)
-        name = ida_entry.get_entry_name(ordinal)
+    global _export_cache
+    if _export_cache is None:
+        ordinals = [ida_entry.get_entry_ordinal(i) for i in range(ida_entry.get_entry_qty())]
+        _export_cache = [(ida_entry.get_entry(ordinal), ida_entry.get_entry_name(ordinal)) for ordinal in ordinals]
+
+    for ea, name in _export_cache:
         yield ea, name
 
 
 def iter_functions(func_names: Union[None, str, List[str]] = None):
     """
     Iterate all defined functions and yield their address and name.
-    (This includes imported functions)
+    (This includes imported functions. Each address is only yielded once.)
 
     :param func_names: Filter based on specific function names.
 
@@ -133,6 +206,9 @@ def iter_functions(func_names: Union[None, str, List[str]] = None):
     if isinstance(func_names, str):
         func_names = [func_names]
 
+    # Track yielded addresses, since thunk functions for imports are also declared functions.
+    seen = set()
+
     # Yield declared functions.
     for ea in idautils.Functions():
         name = idc.get_func_name(ea)
@@ -142,11 +218,14 @@ def iter_functions(func_names: Union[None, str, List[str]] = None):
             or name.strip("_") in func_names
             or any(re.match("_*{}_[0-9]?".format(name_), name) for name_ in func_names)
         ):
+            seen.add(ea)
             yield ea, name
 
     # Also yield from imported.
     for ea, name, _ in iter_imports(api_names=func_names):
-        yield ea, name
+        if ea not in seen:
+            seen.add(ea)
+            yield ea, name
 
 
 def get_import_addr(api_name, module_name=None):
@@ -174,9 +253,13 @@ def get_export_addr(export_name):
 
     :return: Location of target export or None
     """
-    for ea, name in iter_exports():
-        if name == export_name:
-            return ea
+    global _export_addrs
+    if _export_addrs is None:
+        _export_addrs = {}
+        for ea, name in iter_exports():
+            # Keep the first export for a name.
+            _export_addrs.setdefault(name, ea)
+    return _export_addrs.get(export_name)
 
 
 def get_function_addr(func_name: str):
@@ -202,21 +285,19 @@ def lines(start=None, end=None, reverse=False, max_steps=None):
     :param max_steps: Maximum number of steps to iterate.
     :yields: instructions addresses
     """
-    max_ea = idaapi.cvar.inf.maxEA
-    min_ea = idaapi.cvar.inf.minEA
-
     # Normalize start and end addresses.
+    # (Database bounds are only looked up when needed.)
     if reverse:
         if start is None:
-            start = max_ea - 1
+            start = idc.get_inf_attr(idc.INF_MAX_EA) - 1
         if end is None:
             end = 0
         start = max(start, end)
     else:
         if start is None:
-            start = min_ea
+            start = idc.get_inf_attr(idc.INF_MIN_EA)
         if end is None:
-            end = max_ea + 1
+            end = idc.get_inf_attr(idc.INF_MAX_EA) + 1
         start = min(start, end)
 
     steps = 0
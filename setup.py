@@ -54,7 +54,6 @@ setup(
         'yara-python',
         'ruamel.yaml',
         'setuptools',
-        'six',
 
         # For the server and API
         'flask~=1.1.0',
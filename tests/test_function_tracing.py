@@ -49,6 +49,23 @@ def test_flowchart():
     assert found_block
     assert found_block.start_ea == 0x004035AB
 
+    # find_blocks() should agree with find_block(), including for addresses outside the function.
+    eas = list(flowchart.heads()) + [0x00403596, 0x004035BD]
+    assert flowchart.find_blocks(eas) == [flowchart.find_block(ea) for ea in eas]
+    found_blocks = flowchart.find_blocks([0x004035AD, 0x00403596])
+    assert found_blocks[0].start_ea == 0x004035AB
+    assert found_blocks[1] is None
+
+    # instructions() should follow heads() along with each instruction's decoded information.
+    for block in flowchart.blocks():
+        assert [ip for ip, _ in block.instructions()] == list(block.heads())
+    assert list(found_block.instructions()) == [
+        (0x004035AB, ("mov", None, 0x004035AD)),
+        (0x004035AD, ("test", None, 0x004035AF)),
+        (0x004035AF, ("jz", None, 0x004035B1)),
+    ]
+    assert [ip for ip, _ in found_block.instructions(0x004035AD)] == [0x004035AD, 0x004035AF]
+
     blocks = list(flowchart.blocks(start=0x004035AB, reverse=True))
     assert len(blocks) == 2
     assert [(block.start_ea, block.end_ea) for block in blocks] == [(0x004035AB, 0x004035B1), (0x00403597, 0x004035AB)]
@@ -99,6 +116,10 @@ def test_flowchart():
         (0x004035AB, 0x004035B1),
         (0x00403597, 0x004035AB),
     ]
+    # Reverse traversal from within the loop must not follow the back edge (0x004035B3 -> 0x004035AB).
+    for dfs in (False, True):
+        blocks = list(flowchart.blocks(start=0x004035B6, reverse=True, dfs=dfs))
+        assert [block.start_ea for block in blocks] == [0x004035B3, 0x004035B1, 0x004035AB, 0x00403597]
 
     path_blocks = list(flowchart.get_paths(0x004035B1))
     assert len(path_blocks) == 1
@@ -112,6 +133,22 @@ def test_flowchart():
         [0x00403597, 0x004035BA],
     ]
 
+    # Test on a function with a loop whose back edge (0x0040100D -> 0x00401003) comes from a higher address.
+    flowchart = function_tracing.FlowChart(0x00401000)
+    for dfs in (False, True):
+        blocks = list(flowchart.blocks(reverse=True, dfs=dfs))
+        assert [(block.start_ea, block.end_ea) for block in blocks] == [
+            (0x00401029, 0x0040102B),
+            (0x00401003, 0x0040100D),
+            (0x00401000, 0x00401003),
+        ]
+        blocks = list(flowchart.blocks(start=0x0040101C, reverse=True, dfs=dfs))
+        assert [(block.start_ea, block.end_ea) for block in blocks] == [
+            (0x0040100D, 0x00401029),
+            (0x00401003, 0x0040100D),
+            (0x00401000, 0x00401003),
+        ]
+
 
 @pytest.mark.in_ida
 def test_cpu_context():
@@ -274,6 +311,21 @@ def test_memory():
     assert m.read(second_alloc_realloced_ea, 10) == b"helloworld"  # data should be copied over.
 
 
+@pytest.mark.in_ida
+def test_struct_unpack_many():
+    """Tests bulk unpacking of values."""
+    from kordesii.utils.function_tracing import utils
+    from kordesii.utils.function_tracing.exceptions import FunctionTracingError
+
+    data = b"\x01\x00\xff\xff\x02\x00\x00\x80"
+    assert utils.struct_unpack_many(data, 2).tolist() == [0x1, 0xFFFF, 0x2, 0x8000]
+    assert utils.struct_unpack_many(data, 2, signed=True).tolist() == [1, -1, 2, -0x8000]
+    assert utils.struct_unpack_many(data, 4).tolist() == [utils.struct_unpack(data[:4]), utils.struct_unpack(data[4:])]
+    assert utils.struct_unpack_many(data, 1, count=3).tolist() == [0x1, 0x0, 0xFF]
+    with pytest.raises(FunctionTracingError):
+        utils.struct_unpack_many(data, 16)
+
+
 @pytest.mark.in_ida
 def test_registers():
     """Tests registers"""
@@ -0,0 +1,235 @@
+"""
+Tests Reporter functionality.
+"""
+
+import base64
+import gc
+import hashlib
+import logging
+import os
+import weakref
+
+import kordesii
+from kordesii import logutil
+from kordesii.reporter import ReporterLogHandler
+
+
+def test_add_output_file(tmpdir):
+    """Tests adding output files from data or from a path."""
+    data = bytes(range(256)) * 1000
+    md5 = hashlib.md5(data).hexdigest()
+    file_path = tmpdir / "out.bin"
+    file_path.write_binary(data)
+
+    reporter = kordesii.Reporter(base64outputfiles=True)
+    reporter.add_output_file("a.bin", data, "from data")
+    reporter.add_output_file("b.bin", path=str(file_path), description="from path")
+    assert reporter.metadata["files"] == [
+        ["a.bin", "from data", md5, base64.b64encode(data).decode("latin1")],
+        ["b.bin", "from path", md5, base64.b64encode(data).decode("latin1")],
+    ]
+    assert reporter.get_file_contents("a.bin") == data
+    assert reporter.get_file_contents("b.bin") == data
+    assert reporter.get_file_contents("c.bin") is None
+    # Raw contents are not held onto once base64 encoded.
+    assert not reporter._raw_files
+
+    reporter = kordesii.Reporter()
+    reporter.add_output_file("a.bin", data)
+    assert reporter.metadata["files"] == [["a.bin", "", md5]]
+    assert reporter.get_file_contents("a.bin") is None
+
+    # Changes to a mutable buffer after it is added shouldn't affect the output file.
+    buffer = bytearray(data)
+    reporter = kordesii.Reporter(base64outputfiles=True)
+    reporter.add_output_file("a.bin", buffer)
+    buffer[:4] = b"\x00\x00\x00\x00"
+    assert reporter.get_file_contents("a.bin") == data
+    assert reporter.metadata["files"] == [["a.bin", "", md5, base64.b64encode(data).decode("latin1")]]
+
+
+def test_get_output_text():
+    """Tests the human readable report."""
+    reporter = kordesii.Reporter()
+    assert reporter.get_output_text() == "----Decoded Strings----\n\nNo decoded strings found\n"
+
+    reporter.add_string("hello")
+    reporter.add_string("new\nline•")
+    reporter.add_output_file("a.bin", b"data")
+    reporter.errors.append("[!] bad")
+    assert reporter.get_output_text() == (
+        "----Decoded Strings----\n\n"
+        "hello\n"
+        "new\\nline\\u2022\n"
+        "\n----Files----\n\n"
+        "a.bin\n"
+        "\n----Errors----\n\n"
+        "[!] bad\n"
+    )
+
+
+def test_get_file_contents_cache():
+    """Tests cached file contents are invalidated when a file is re-added."""
+    reporter = kordesii.Reporter(base64outputfiles=True)
+    reporter.add_output_file("a.bin", b"first")
+    assert reporter.get_file_contents("a.bin") == b"first"
+    assert reporter.get_file_contents("a.bin") == b"first"
+    reporter.add_output_file("a.bin", b"second")
+    assert reporter.get_file_contents("a.bin") == b"second"
+
+    # Once encoded, decoded contents are cached, but only for the most recently used files.
+    for i in range(20):
+        reporter.add_output_file("{}.bin".format(i), b"data %d" % i)
+    assert reporter.metadata
+    assert not reporter._raw_files
+    for i in range(20):
+        assert reporter.get_file_contents("{}.bin".format(i)) == b"data %d" % i
+    assert len(reporter._file_bytes_cache) == kordesii.reporter._FILE_CACHE_SIZE
+    assert reporter.get_file_contents("a.bin") == b"second"
+
+
+def test_log_handler():
+    """Tests log messages are collected into the reporter."""
+    reporter = kordesii.Reporter()
+    handler = ReporterLogHandler(reporter)
+    handler.addFilter(logutil.LevelCharFilter())
+
+    logger = logging.getLogger("test_reporter")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        logger.debug("not collected")
+        logger.info("info %d", 1)
+        logger.warning("warning")
+        logger.error("error %s", "message")
+        try:
+            raise ValueError("bad")
+        except ValueError:
+            logger.exception("exception")
+            logger.warning("warning with traceback", exc_info=True)
+    finally:
+        logger.removeHandler(handler)
+
+    debug = reporter.metadata["debug"]
+    assert debug[:2] == ["[+] info 1", "[-] warning"]
+    assert debug[2].startswith("[-] warning with traceback\nTraceback (most recent call last):")
+    assert debug[2].endswith("ValueError: bad")
+    assert len(debug) == 3
+    assert reporter.errors[0] == "error message"
+    # Tracebacks are included even though the handler has no formatter.
+    assert reporter.errors[1].startswith("exception\nTraceback (most recent call last):")
+    assert reporter.errors[1].endswith("ValueError: bad")
+    assert len(reporter.errors) == 2
+
+
+def test_reporter_freed(tmpdir):
+    """Tests a Reporter and its managed temporary directory are freed without the garbage collector."""
+    reporter = kordesii.Reporter(tempdir=str(tmpdir))
+    managed_tempdir = reporter.managed_tempdir()
+    assert os.path.isdir(managed_tempdir)
+    ref = weakref.ref(reporter)
+    gc.disable()
+    try:
+        del reporter
+        assert ref() is None
+        assert not os.path.exists(managed_tempdir)
+    finally:
+        gc.enable()
+
+
+def test_run_decoder_reuse(tmpdir):
+    """Tests reusing a Reporter on multiple runs."""
+    input_file = tmpdir / "input.bin"
+    input_file.write_binary(b"data")
+
+    reporter = kordesii.Reporter()
+    for _ in range(2):
+        reporter.run_decoder("does_not_exist", filename=str(input_file))
+        assert reporter.errors == ["Could not find decoder with name: does_not_exist"]
+        assert reporter._log_handler not in logging.root.handlers
+
+
+def test_get_serialized(tmpdir):
+    """Tests serialized data files are accessible regardless of base64 output."""
+    yml_path = tmpdir / "other_data.yml"
+    yml_path.write_binary(b"entry_1: hello\n")
+
+    for base64outputfiles in (False, True):
+        reporter = kordesii.Reporter(base64outputfiles=base64outputfiles)
+        reporter.add_output_file("other_data.yml", path=str(yml_path))
+        assert reporter.other_data == {"entry_1": "hello"}
+        assert reporter.metadata["other_data"] == "entry_1: hello\n"
+
+
+def test_reserve_strings():
+    """Tests preallocating strings."""
+    reporter = kordesii.Reporter()
+    reporter.add_string("a")
+    reporter.reserve_strings(3)
+    reporter.add_string("b")
+    reporter.add_string(b"c")
+    assert reporter.get_strings() == ["a", "b", "c"]
+
+    reporter.reserve_strings(2)
+    for string in ("d", "e", "f"):
+        reporter.add_string(string)
+    assert reporter.metadata["strings"] == ["a", "b", "c", "d", "e", "f"]
+
+    # Logging shouldn't throw away the reservation.
+    reporter = kordesii.Reporter()
+    reporter.reserve_strings(5)
+    reporter._log_handler.handle(logging.makeLogRecord({"msg": "info", "levelno": logging.INFO}))
+    assert reporter._strings_cursor == 0
+    reporter.add_string("a")
+    assert len(reporter._metadata["strings"]) == 5
+
+    # A list that has already been returned never picks up placeholders.
+    strings = reporter.get_strings()
+    assert strings == ["a"]
+    reporter.add_string("b")
+    assert strings == ["a", "b"]
+    reporter.reserve_strings(3)
+    reporter.add_string("c")
+    assert strings == ["a", "b"]
+    assert reporter.get_strings() == ["a", "b", "c"]
+    metadata_strings = reporter.metadata["strings"]
+    reporter.reserve_strings(2)
+    assert metadata_strings == ["a", "b", "c"]
+    assert reporter.metadata == {"strings": ["a", "b", "c"], "debug": ["[+] info"]}
+
+
+def test_run_decoder_data(tmpdir, monkeypatch):
+    """Tests input data is written to a temporary file named after its md5."""
+    data = b"data" * 1000
+    seen = []
+
+    class Decoder:
+        full_name = "test"
+
+        def run(self, input_file, reporter, **run_config):
+            with open(input_file, "rb") as fo:
+                seen.append((os.path.basename(input_file), fo.read()))
+
+    tempdir = tmpdir.mkdir("temp")
+    reporter = kordesii.Reporter(tempdir=str(tempdir))
+    monkeypatch.setattr(kordesii, "iter_decoders", lambda name: [Decoder()])
+    reporter.run_decoder("test", data=data)
+
+    assert seen == [(hashlib.md5(data).hexdigest(), data)]
+    # Temporary directory should be cleaned up.
+    assert not tempdir.listdir()
+
+
+def test_get_serialized_shared_cache():
+    """Tests cached serialized data is not shared between reporters."""
+    yml_data = b"entry_1: shared\n"
+    reporter_a = kordesii.Reporter()
+    reporter_a.add_output_file("test.yml", yml_data)
+    reporter_b = kordesii.Reporter()
+    reporter_b.add_output_file("test.yml", yml_data)
+
+    data = reporter_a.get_serialized("test")
+    assert data == {"entry_1": "shared"}
+    data["injected"] = 1
+    assert reporter_b.get_serialized("test") == {"entry_1": "shared"}
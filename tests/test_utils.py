@@ -84,3 +84,29 @@ def test_iter_functions():
     assert list(utils.iter_functions('memcpy')) == [(0x405c00, '_memcpy'), (0x408d50, '_memcpy_0')]
     assert list(utils.iter_functions('_memcpy')) == [(0x405c00, '_memcpy'), (0x408d50, '_memcpy_0')]
     assert list(utils.iter_functions('_memcpy_0')) == [(0x408d50, '_memcpy_0')]
+
+
+@pytest.mark.in_ida
+def test_cache():
+    from kordesii.utils import utils
+    from kordesii.utils.function_tracing import utils as function_tracing_utils
+
+    function_tracing_utils.is_func_ptr(0x405c00)
+    assert function_tracing_utils._is_func_ptr_cache
+    imports = list(utils.iter_imports())
+    exports = list(utils.iter_exports())
+    assert utils._import_cache is not None
+    assert utils._export_cache is not None
+    assert list(utils.iter_imports()) == imports
+    assert list(utils.iter_exports()) == exports
+    utils.clear_cache()
+    assert utils._import_cache is None
+    assert utils._export_cache is None
+    assert utils._export_addrs is None
+    assert not function_tracing_utils._func_data_cache
+    assert not function_tracing_utils._is_func_ptr_cache
+    assert utils.get_export_addr("start") == 0x4014e0
+    assert utils.get_export_addr("missing") is None
+    assert utils.get_import_addr("GetProcAddress") == 0x40a028
+    assert list(utils.iter_imports()) == imports
+    assert list(utils.iter_exports()) == exports